@@ -1,21 +1,121 @@
 import streamlit as st
 import os
+import io
 import pandas as pd
+import numpy as np
 import json
 import re
-from PyPDF2 import PdfReader
-from docx import Document
+import hashlib
+import asyncio
+import threading
+import zipfile
+from functools import lru_cache
+from pypdf import PdfReader
+from lxml import etree
 import google.generativeai as genai
 from dotenv import load_dotenv
 from dateutil.parser import parse
 from datetime import datetime
 import json_repair
+import orjson
+import diskcache
+from concurrent.futures import as_completed
 
 # Load environment variables
 load_dotenv()
 
 # Configure Gemini
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+MAX_CONCURRENT_REQUESTS = 8
+
+# Static part of the prompt, sent as a system instruction so each
+# request only carries the resume text
+RESUME_INSTRUCTIONS = """
+Analyze the resume provided by the user and return STRICT VALID JSON with this structure:
+{
+    "name": "full name",
+    "email": "email address",
+    "phone": "phone number",
+    "skills": ["list", "of", "skills"],
+    "experience": [
+        {
+            "title": "job title",
+            "duration": "MM/YYYY - MM/YYYY"
+        }
+    ]
+}
+
+RULES:
+1. Duration format must be "MM/YYYY - MM/YYYY"
+2. Use '-' as date separator
+3. Convert "Present" to current month/year
+4. Include ALL experience entries
+5. Dates contain only the month and year digits, e.g. "03/2021"; no words or days
+"""
+
+# Cached results are keyed on the model and prompt as well as the input,
+# so changing either stops old results being served; entries also age out
+CACHE_VERSION = hashlib.blake2b(f"{GEMINI_MODEL}\n{RESUME_INSTRUCTIONS}".encode(), digest_size=8).hexdigest()
+CACHE_EXPIRE = 7 * 24 * 60 * 60
+
+# Patterns for experience entries and their dates
+_DUR_RE = re.compile(r"\(([^)]*)\)")
+_MMYYYY_RE = re.compile(r"\s*(\d{1,2})/(\d{4})\s*$")
+
+# WordprocessingML tags read from DOCX files
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_T, _W_TAB, _W_BR = (_W_NS + tag for tag in ("p", "t", "tab", "br"))
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+@st.cache_resource
+def get_cache(directory):
+    """Open a disk-backed cache that survives Streamlit reruns"""
+    return diskcache.Cache(directory)
+
+def cache_key(content):
+    """Build a cache key for file or text content under the current model and prompt"""
+    return f"{CACHE_VERSION}:{hashlib.blake2b(content, digest_size=16).hexdigest()}"
+
+@st.cache_resource
+def get_event_loop():
+    """Start a long-lived event loop for Gemini calls in a background thread"""
+    # The async Gemini client binds its channel to the loop it was created on,
+    # so one loop is kept for the whole process instead of one per rerun
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def get_request_limiter():
+    """Cap concurrent Gemini requests across all sessions to stay under rate limits"""
+    # Called from the event-loop thread, so the semaphore belongs to that loop
+    return asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+@st.cache_resource(show_spinner=False)
+def get_model(name=GEMINI_MODEL):
+    """Build the Gemini model once and share it across calls and reruns"""
+    return genai.GenerativeModel(name, system_instruction=RESUME_INSTRUCTIONS)
+
+def iter_docx_paragraphs(file):
+    """Stream paragraph text out of a DOCX without building the full document tree"""
+    with zipfile.ZipFile(file) as docx, docx.open('word/document.xml') as xml:
+        # Uploads are untrusted: never resolve entities or fetch external resources
+        for _, para in etree.iterparse(xml, tag=_W_P, resolve_entities=False, no_network=True):
+            # Word saves text boxes twice; skip the legacy mc:Fallback copy
+            if next(para.iterancestors(_MC_FALLBACK), None) is None:
+                parts = []
+                for node in para.iter(_W_T, _W_TAB, _W_BR):
+                    if node.tag == _W_T:
+                        parts.append(node.text or "")
+                    else:
+                        parts.append("\t" if node.tag == _W_TAB else "\n")
+                yield "".join(parts)
+
+            # Drop handled elements so the tree doesn't grow with the document
+            para.clear()
+            while para.getprevious() is not None:
+                del para.getparent()[0]
 
 def extract_text_from_file(file):
     """Extract text from PDF/DOCX files"""
@@ -23,46 +123,85 @@ def extract_text_from_file(file):
     try:
         if file.type == "application/pdf":
             pdf_reader = PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
+            text = "\n".join(page.extract_text() or "" for page in pdf_reader.pages)
+            if pdf_reader.pages and not text.strip():
+                st.error(f"{file.name} has no extractable text (scanned or image-only PDF?)")
+                return None
         elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = Document(file)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
+            text = "\n".join(iter_docx_paragraphs(file))
     except Exception as e:
         st.error(f"Error reading {file.name}: {str(e)}")
         return None
     return text
 
-def calculate_experience(experience_entries):
-    """Calculate total work experience in years from experience entries"""
-    total_days = 0
-    
-    for entry in experience_entries:
-        if isinstance(entry, dict):
-            duration = entry.get('duration', '')
-        else:
-            # Extract duration from formatted string
-            duration_match = re.search(r"\((.*?)\)", entry)
-            duration = duration_match.group(1) if duration_match else ''
-        
-        try:
-            if '-' in duration or '–' in duration:
-                # Handle different separators
-                separator = '-' if '-' in duration else '–'
-                start_str, end_str = map(str.strip, duration.split(separator))
-                
-                # Parse dates
-                end_date = datetime.now() if end_str.lower() == 'present' else parse(end_str, fuzzy=True)
-                start_date = parse(start_str, fuzzy=True)
-                
-                # Calculate duration in days
-                delta = end_date - start_date
-                total_days += delta.days
-        except Exception as e:
-            continue
-    
-    return round(total_days / 365.25, 2)
+def looks_like_resume(text):
+    """Cheap check that extracted text is long and readable enough to send to Gemini"""
+    text = text.strip()
+    if len(text) < 200:
+        return False
+    # Whitespace varies with the extractor (blank DOCX paragraphs, padded PDF
+    # lines), so only visible characters count towards the letter ratio
+    sample = [c for c in text[:2000] if not c.isspace()]
+    return sum(c.isalpha() for c in sample) / len(sample) >= 0.5
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str):
+    """Parse a resume date, taking a fast path for the prompted MM/YYYY format"""
+    match = _MMYYYY_RE.match(date_str)
+    if match:
+        return datetime(int(match[2]), int(match[1]), 1)
+    # Strict parsing handles most other shapes; fuzzy is the slow last resort
+    try:
+        return parse(date_str)
+    except (ValueError, OverflowError):
+        return parse(date_str, fuzzy=True)
+
+def parse_duration(entry):
+    """Return (start, end) dates of an experience entry, or None if unparseable"""
+    if isinstance(entry, dict):
+        duration = entry.get('duration', '')
+    elif isinstance(entry, str):
+        # Extract duration from formatted string
+        duration_match = _DUR_RE.search(entry)
+        duration = duration_match.group(1) if duration_match else ''
+    else:
+        return None
+    if not isinstance(duration, str):
+        return None
+
+    try:
+        if '-' in duration or '–' in duration:
+            # Handle different separators
+            separator = '-' if '-' in duration else '–'
+            start_str, end_str = map(str.strip, duration.split(separator))
+
+            # Parse dates
+            end_date = datetime.now() if end_str.lower() == 'present' else parse_date(end_str)
+            start_date = parse_date(start_str)
+            return start_date, end_date
+    except Exception as e:
+        pass
+    return None
+
+def calculate_experience(experience_lists):
+    """Calculate total work experience in years for each resume's experience entries"""
+    owners, starts, ends = [], [], []
+    for i, experience_entries in enumerate(experience_lists):
+        for entry in experience_entries:
+            dates = parse_duration(entry)
+            if dates:
+                owners.append(i)
+                starts.append(dates[0])
+                ends.append(dates[1])
+
+    # Sum day counts per resume in one pass over all entries
+    days = np.array(ends, dtype='datetime64[D]') - np.array(starts, dtype='datetime64[D]')
+    total_days = np.bincount(
+        np.array(owners, dtype=np.intp),
+        weights=days.astype(np.float64),
+        minlength=len(experience_lists)
+    )
+    return np.round(total_days / 365.25, 2)
 
 def format_experience(experience):
     """Format experience entries as comma-separated titles with durations"""
@@ -72,60 +211,71 @@ def format_experience(experience):
             title = entry.get('title', 'N/A')
             duration = entry.get('duration', 'N/A')
             formatted.append(f"{title} ({duration})")
-        else:
-            match = re.search(r"Title: (.*?)\n.*Duration: (.*?)\n", entry)
-            if match:
-                title, duration = match.groups()
+        elif isinstance(entry, str):
+            title = duration = ''
+            if "Title:" in entry and "Duration:" in entry:
+                _, _, rest = entry.partition("Title:")
+                title, _, rest = rest.partition("\n")
+                _, _, rest = rest.partition("Duration:")
+                duration, _, _ = rest.partition("\n")
+            if title.strip() and duration.strip():
                 formatted.append(f"{title.strip()} ({duration.strip()})")
             else:
                 formatted.append(entry)
     return ", ".join(formatted)
 
-def parse_resume_with_gemini(resume_text):
+async def parse_resume_with_gemini(resume_text):
     """Use Gemini to parse resume content"""
-    prompt = f"""
-    Analyze this resume and return STRICT VALID JSON with this structure:
-    {{
-        "name": "full name",
-        "email": "email address",
-        "phone": "phone number",
-        "skills": ["list", "of", "skills"],
-        "experience": [
-            {{
-                "title": "job title",
-                "duration": "MM/YYYY - MM/YYYY"
-            }}
-        ]
-    }}
-
-    RULES:
-    1. Duration format must be "MM/YYYY - MM/YYYY"
-    2. Use '-' as date separator
-    3. Convert "Present" to current month/year
-    4. Include ALL experience entries
-
-    Resume Text:
-    {resume_text}
-    """
-    
+    async with get_request_limiter():
+        response = await get_model().generate_content_async(resume_text)
+    raw_output = response.text
+
+    # Keep only the outermost {...}; code fences and prose fall outside it.
+    # If there are no braces, json_repair copes with the raw text itself.
+    start = raw_output.find('{')
+    end = raw_output.rfind('}')
+    cleaned_output = raw_output[start:end + 1] if start != -1 and end != -1 else raw_output
+
+    # Well-formed JSON is the common case; only repair when strict parsing fails
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
-        raw_output = response.text
-        
-        # Clean JSON response
-        cleaned_output = re.sub(r'^[^{]*{', '{', raw_output, 1, re.DOTALL)
-        cleaned_output = re.sub(r'}[^}]*$', '}', cleaned_output, 1, re.DOTALL)
-        cleaned_output = cleaned_output.strip().replace("```json", "").replace("```", "")
-        
+        return orjson.loads(cleaned_output)
+    except orjson.JSONDecodeError:
         return json_repair.loads(cleaned_output)
-    except Exception as e:
-        st.error(f"Gemini API Error: {str(e)}")
+
+def normalize_resume(data):
+    """Coerce parsed Gemini output into the shape the formatters expect; None if unusable"""
+    if not isinstance(data, dict) or not data:
         return None
+    data = dict(data)
+    skills = data.get('skills')
+    data['skills'] = [str(skill) for skill in skills if skill is not None] if isinstance(skills, list) else []
+    experience = data.get('experience')
+    data['experience'] = (
+        [entry for entry in experience if isinstance(entry, (dict, str))]
+        if isinstance(experience, list) else []
+    )
+    return data
+
+def format_resume(data, filename):
+    """Build a table row from parsed resume data"""
+    exp_entries = data.get('experience', [])
+
+    # Add formatted fields; experience_in_years is filled per batch
+    row = dict(data)
+    row['experience'] = format_experience(exp_entries)
+    row['skills'] = ", ".join(data.get('skills', []))
+    row['filename'] = filename
+    return row
+
+def to_excel_bytes(df):
+    """Serialize a DataFrame to XLSX bytes in memory"""
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, engine='xlsxwriter')
+    return buffer.getvalue()
 
 def reset_session():
     """Clear all session state data"""
-    keys_to_reset = ['uploaded_files', 'parsed_data', 'file_uploader']
+    keys_to_reset = ['uploaded_files', 'parsed_data', 'excel_bytes', 'file_uploader']
     for key in keys_to_reset:
         if key in st.session_state:
             del st.session_state[key]
@@ -158,38 +308,66 @@ def main():
     # Parse button
     if st.session_state.uploaded_files and st.session_state.parsed_data is None:
         if st.button("🚀 Parse Resumes", use_container_width=True):
-            all_data = []
-            success_count = 0
-            fail_count = 0
-            
-            for file in st.session_state.uploaded_files:
-                try:
-                    with st.spinner(f"Processing {file.name}..."):
+            files = st.session_state.uploaded_files
+            parsed = [None] * len(files)
+            file_cache = st.session_state.setdefault('file_cache', {})
+            disk_cache = get_cache(".file_cache")
+            text_cache = get_cache(".resume_cache")
+            loop = get_event_loop()
+
+            with st.status(f"Processing {len(files)} resumes...") as status:
+                # Files seen before (same bytes or same text) skip Gemini;
+                # the rest are sent concurrently on the shared event loop
+                futures = {}
+                for i, file in enumerate(files):
+                    file_key = cache_key(file.getvalue())
+                    data = normalize_resume(file_cache.get(file_key) or disk_cache.get(file_key))
+                    if not data:
                         text = extract_text_from_file(file)
                         if not text:
-                            fail_count += 1
                             continue
-
-                        data = parse_resume_with_gemini(text)
+                        if not looks_like_resume(text):
+                            st.warning(f"Skipped {file.name}: too little readable text to parse")
+                            continue
+                        text_key = cache_key(text.encode())
+                        data = normalize_resume(text_cache.get(text_key))
                         if not data:
-                            fail_count += 1
+                            future = asyncio.run_coroutine_threadsafe(parse_resume_with_gemini(text), loop)
+                            futures[future] = (i, file_key, text_key)
                             continue
+                    parsed[i] = data
+                    file_cache[file_key] = data
+
+                for done, future in enumerate(as_completed(futures), 1):
+                    index, file_key, text_key = futures[future]
+                    try:
+                        data = normalize_resume(future.result())
+                    except Exception as e:
+                        st.error(f"Gemini API Error ({files[index].name}): {str(e)}")
+                        data = None
 
-                        # Process experience data
-                        exp_entries = data.get('experience', [])
-                        
-                        # Add calculated fields
-                        data['experience'] = format_experience(exp_entries)
-                        data['experience_in_years'] = calculate_experience(exp_entries)
-                        data['skills'] = ", ".join(data.get('skills', []))
-                        data['filename'] = file.name
-                        
-                        all_data.append(data)
-                        success_count += 1
+                    if data:
+                        parsed[index] = data
+                        file_cache[file_key] = data
+                        disk_cache.set(file_key, data, expire=CACHE_EXPIRE)
+                        text_cache.set(text_key, data, expire=CACHE_EXPIRE)
+                    status.update(label=f"Parsed {done}/{len(futures)} new resumes")
+                status.update(label=f"Processed {len(files)} resumes", state="complete")
 
+            # Keep rows in upload order regardless of completion order
+            all_data = []
+            experience_lists = []
+            for file, data in zip(files, parsed):
+                if not data:
+                    continue
+                try:
+                    all_data.append(format_resume(data, file.name))
                 except Exception as e:
                     st.error(f"Error processing {file.name}: {str(e)}")
-                    fail_count += 1
+                    continue
+                experience_lists.append(data['experience'])
+            success_count = len(all_data)
+            fail_count = len(files) - success_count
 
             if all_data:
                 # Create DataFrame with ordered columns
@@ -203,14 +381,14 @@ def main():
                     'filename'
                 ]
                 
-                df = pd.DataFrame(all_data)[column_order]
-                # Fix Sno numbering to start from 1
-                df = df.reset_index()
-                df['index'] = df['index'] + 1
-                df = df.rename(columns={'index': 'Sno'})
+                df = pd.DataFrame.from_records(all_data, columns=column_order)
+                df['experience_in_years'] = calculate_experience(experience_lists)
+                # Sno numbering starts from 1
+                df.insert(0, 'Sno', np.arange(1, len(df) + 1, dtype=np.int32))
                 df.insert(1, 'Date', datetime.today().strftime('%Y-%m-%d'))
                 
                 st.session_state.parsed_data = df
+                st.session_state.excel_bytes = to_excel_bytes(df)
                 st.success(f"✅ Parsed {success_count} resumes successfully")
                 if fail_count > 0:
                     st.warning(f"❌ Failed to parse {fail_count} resumes")
@@ -219,11 +397,13 @@ def main():
 
     # Display results
     if st.session_state.parsed_data is not None:
+        # Formatting via column_config happens in the browser, so reruns
+        # don't rebuild a pandas Styler for the whole table
         st.dataframe(
-            st.session_state.parsed_data.style.format({
-                'experience_in_years': '{:.2f} years',
-                'experience': lambda x: x
-            }),
+            st.session_state.parsed_data,
+            column_config={
+                'experience_in_years': st.column_config.NumberColumn(format="%.2f years")
+            },
             height=600,
             use_container_width=True
         )
@@ -231,16 +411,13 @@ def main():
         # Action buttons
         col1, col2 = st.columns(2)
         with col1:
-            excel_file = "Resume_Data.xlsx"
-            st.session_state.parsed_data.to_excel(excel_file, index=False)
-            with open(excel_file, "rb") as f:
-                st.download_button(
-                    "💾 Export Excel",
-                    f.read(),
-                    file_name=excel_file,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+            st.download_button(
+                "💾 Export Excel",
+                st.session_state.excel_bytes,
+                file_name="Resume_Data.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
         with col2:
             if st.button("🔄 Reset", use_container_width=True, on_click=reset_session):
                 st.rerun()